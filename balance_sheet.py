@@ -1,10 +1,182 @@
 # balance_sheet.py
 import streamlit as st
 import pandas as pd
+import numpy as np
+from numba import njit
 import plotly.graph_objects as go
+import plotly.io as pio
 from plotly.subplots import make_subplots
 
-
+YEARS = ["2023A", "2024E", "2025E", "2026E"]
+
+# Historical data (2023)
+_LABELS = (
+    "Cash(F)",
+    "Accounts Receivable(G)",
+    "Prepayments(H)",
+    "Fixed Assets(I)",
+    "Total Assets(F+G+H+I)",  # 移除加粗标记
+    "Accounts Payable(J)",
+    "Advances from Customers(K)",
+    "Total Liabilities(J+K)",  # 移除加粗标记
+    "Share Capital(L)",
+    "Retained Earnings(M)",
+    "Total Equity(L+M)",
+    "Total Liabilities & Equity(J+K+L+M)"  # 移除加粗标记
+)
+_HIST_VALUES = np.array([
+    1260.00, 110.00, 6.00, 16.00, 1392.00,
+    120.00, 10.00, 130.00,
+    1333.52, -71.52, 1262.00, 1392.00
+], dtype=np.float64)
+_HIST_VALUES.flags.writeable = False
+_HIST_DF = pd.DataFrame({"Amount": dict(zip(_LABELS, _HIST_VALUES))}).round(2)
+
+
+@njit(cache=True, fastmath=True)
+def _bs_recurrence(revenues, costs, net_profits, ratios, hist, fixed_asset_growth, capital_increase):
+    """
+    Roll the balance sheet forward one year at a time
+    ratios: receivables, prepayment, payables and advance ratios
+    hist: historical balance sheet values in _LABELS order
+    Returns a (len(hist), len(revenues)) array with the historical year in column 0
+    """
+    n_years = revenues.shape[0]
+    out = np.empty((hist.shape[0], n_years))
+    out[:, 0] = hist
+
+    for i in range(1, n_years):
+        # Calculate assets
+        receivables = revenues[i] * ratios[0]
+        prepayments = costs[i] * ratios[1]
+        fixed_assets = out[3, i - 1] * (1 + fixed_asset_growth)
+
+        # Calculate liabilities
+        payables = costs[i] * ratios[2]
+        advances = revenues[i] * ratios[3]
+        total_liabilities = payables + advances
+
+        # Calculate equity (capital increase lands in the first forecast year)
+        capital = out[8, i - 1] + (capital_increase if i == 1 else 0.0)
+        retained_earnings = out[9, i - 1] + net_profits[i]
+        total_equity = capital + retained_earnings
+
+        # Calculate balancing cash
+        total_liab_equity = total_liabilities + total_equity
+        cash = total_liab_equity - (receivables + prepayments + fixed_assets)
+
+        out[0, i] = cash
+        out[1, i] = receivables
+        out[2, i] = prepayments
+        out[3, i] = fixed_assets
+        out[4, i] = total_liab_equity
+        out[5, i] = payables
+        out[6, i] = advances
+        out[7, i] = total_liabilities
+        out[8, i] = capital
+        out[9, i] = retained_earnings
+        out[10, i] = total_equity
+        out[11, i] = total_liab_equity
+
+    return out
+
+
+# Compile once at import so the first forecast doesn't pay the JIT cost
+_bs_recurrence(np.zeros(len(YEARS)), np.zeros(len(YEARS)), np.zeros(len(YEARS)),
+               np.zeros(4), _HIST_VALUES, 0.0, 0.0)
+
+
+@st.cache_data
+def _compute_bs_forecast(revenues, costs, net_profits, receivables_ratio, prepayment_ratio,
+                         payables_ratio, advance_ratio, fixed_asset_growth, capital_increase):
+    """
+    Compute balance sheet forecast (cached on the P&L tuples and assumptions)
+    revenues, costs, net_profits: tuples of P&L values for all years
+    """
+    forecast_arr = _bs_recurrence(
+        np.asarray(revenues, dtype=np.float64),
+        np.asarray(costs, dtype=np.float64),
+        np.asarray(net_profits, dtype=np.float64),
+        np.array([receivables_ratio, prepayment_ratio, payables_ratio, advance_ratio], dtype=np.float64),
+        _HIST_VALUES,
+        float(fixed_asset_growth),
+        float(capital_increase)
+    )
+
+    # Create forecast DataFrame (rows=line items, cols=years)
+    forecast_df = pd.DataFrame(
+        forecast_arr,
+        index=list(_LABELS),
+        columns=YEARS
+    )
+
+    return forecast_df
+
+
+@st.cache_data
+def _build_bs_figure(forecast_df, debt_ratios, equity_ratios):
+    """Build balance sheet charts and return the serialized figure JSON (cached)"""
+    forecast_arr = forecast_df.to_numpy()
+    bs_rows = dict(zip(forecast_df.index, forecast_arr))
+
+    fig = make_subplots(
+        rows=2, cols=2,
+        subplot_titles=(
+            'Balance Sheet Structure',
+            'Asset Composition',
+            'Key Ratios Trend',
+            'Equity & Liability Composition'
+        ),
+        specs=[[{"type": "bar"}, {"type": "pie"}],
+               [{"type": "scatter"}, {"type": "pie"}]]
+    )
+
+    # Balance Sheet Structure
+    bar_assets = go.Bar(name='Total Assets',
+                        x=YEARS,
+                        y=bs_rows["Total Assets(F+G+H+I)"],
+                        marker_color='lightblue')
+    bar_equity = go.Bar(name='Total Equity',
+                        x=YEARS,
+                        y=bs_rows["Total Equity(L+M)"],
+                        marker_color='darkblue')
+
+    # Asset Composition (latest year): Cash, AR, Prepayments and Fixed Assets are the first four rows
+    pie_assets = go.Pie(values=forecast_arr[:4, -1],
+                        labels=['Cash', 'AR', 'Prepayments', 'Fixed Assets'],
+                        name="Asset Composition")
+
+    # Key Ratios Trend
+    scatter_debt = go.Scatter(x=YEARS, y=debt_ratios,
+                              name='Debt Ratio',
+                              mode='lines+markers')
+    scatter_equity = go.Scatter(x=YEARS, y=equity_ratios,
+                                name='Equity Ratio',
+                                mode='lines+markers')
+
+    # Liability & Equity Composition (latest year)
+    pie_le = go.Pie(values=np.array([bs_rows["Total Liabilities(J+K)"][-1],
+                                     bs_rows["Total Equity(L+M)"][-1]]),
+                    labels=['Liabilities', 'Equity'],
+                    name="L&E Composition")
+
+    # Add all traces in a single validation pass
+    fig.add_traces(
+        [bar_assets, bar_equity, pie_assets, scatter_debt, scatter_equity, pie_le],
+        rows=[1, 1, 1, 2, 2, 2],
+        cols=[1, 1, 2, 1, 1, 2]
+    )
+    fig.update_layout(
+        height=800,
+        width=None,  # 自动适应宽度
+        showlegend=True,
+        margin=dict(l=20, r=20, t=40, b=20)  # 减少边距
+    )
+
+    return fig.to_json()
+
+
+@st.fragment
 def create_balance_sheet_section(profit_loss_data):
     """
     Create balance sheet forecast section
@@ -12,28 +184,10 @@ def create_balance_sheet_section(profit_loss_data):
     """
     left_column, right_column = st.columns([1.2, 1.8])
 
-    # Historical data (2023)
-    historical_bs = {
-        "Cash(F)": 1260.00,
-        "Accounts Receivable(G)": 110.00,
-        "Prepayments(H)": 6.00,
-        "Fixed Assets(I)": 16.00,
-        "Total Assets(F+G+H+I)": 1392.00,  # 移除加粗标记
-        "Accounts Payable(J)": 120.00,
-        "Advances from Customers(K)": 10.00,
-        "Total Liabilities(J+K)": 130.00,  # 移除加粗标记
-        "Share Capital(L)": 1333.52,
-        "Retained Earnings(M)": -71.52,
-        "Total Equity(L+M)": 1262.00,
-        "Total Liabilities & Equity(J+K+L+M)": 1392.00  # 移除加粗标记
-    }
-
     with left_column:
         st.subheader("Historical Data (2023)")
-        hist_df = pd.DataFrame({"Amount": historical_bs}).round(2)
-
         st.dataframe(
-            hist_df,
+            _HIST_DF,
             width=800,  # 增加宽度
             height=None  # 自动调整高度
         )
@@ -62,200 +216,86 @@ def create_balance_sheet_section(profit_loss_data):
 
     if st.button("Generate Balance Sheet Forecast"):
         try:
-            years = ["2023A", "2024E", "2025E", "2026E"]
-            revenues = profit_loss_data.loc["Revenue(A)"].values
-            costs = profit_loss_data.loc["Cost(B)"].values
-            net_profits = profit_loss_data.loc["Net Profit(A-B-C-D-E)"].values
-
-            # Initialize forecast data
-            forecast_data = {k: [v] for k, v in historical_bs.items()}
-
-            # Generate forecast
-            for i in range(1, 4):  # 3 forecast years
-                # Calculate assets
-                receivables = revenues[i] * receivables_ratio
-                prepayments = costs[i] * prepayment_ratio
-                fixed_assets = forecast_data["Fixed Assets(I)"][-1] * (1 + fixed_asset_growth)
-
-                # Calculate liabilities
-                payables = costs[i] * payables_ratio
-                advances = revenues[i] * advance_ratio
-                total_liabilities = payables + advances
-
-                # Calculate equity
-                capital = forecast_data["Share Capital(L)"][-1] + (capital_increase if i == 1 else 0)
-                retained_earnings = forecast_data["Retained Earnings(M)"][-1] + net_profits[i]
-                total_equity = capital + retained_earnings
-
-                # Calculate balancing cash
-                total_liab_equity = total_liabilities + total_equity
-                other_assets = receivables + prepayments + fixed_assets
-                cash = total_liab_equity - other_assets
-
-                # Update forecast data
-                forecast_data["Cash(F)"].append(cash)
-                forecast_data["Accounts Receivable(G)"].append(receivables)
-                forecast_data["Prepayments(H)"].append(prepayments)
-                forecast_data["Fixed Assets(I)"].append(fixed_assets)
-                forecast_data["Total Assets(F+G+H+I)"].append(total_liab_equity)
-                forecast_data["Accounts Payable(J)"].append(payables)
-                forecast_data["Advances from Customers(K)"].append(advances)
-                forecast_data["Total Liabilities(J+K)"].append(total_liabilities)
-                forecast_data["Share Capital(L)"].append(capital)
-                forecast_data["Retained Earnings(M)"].append(retained_earnings)
-                forecast_data["Total Equity(L+M)"].append(total_equity)
-                forecast_data["Total Liabilities & Equity(J+K+L+M)"].append(total_liab_equity)
-
-            # Create forecast DataFrame
-            forecast_df = pd.DataFrame(forecast_data, index=years).T
-
-            def style_dataframe(df):
-                """为DataFrame添加样式"""
-                return df.style.apply(lambda x: ['font-weight: bold' if i in [
-                    'Total Assets(F+G+H+I)',
-                    'Total Liabilities(J+K)',
-                    'Total Liabilities & Equity(J+K+L+M)'
-                ] else '' for i in x.index], axis=0)
-
-            # Display results
-            with right_column:
-                # Key metrics
-                st.subheader("Key Metrics")
-                col1, col2, col3 = st.columns(3)
-
-                with col1:
-                    debt_ratios = [
-                        l / a for l, a in zip(
-                            forecast_df.loc["Total Liabilities(J+K)"],
-                            forecast_df.loc["Total Assets(F+G+H+I)"]
-                        )
-                    ]
-                    st.metric(
-                        "Debt Ratio",
-                        f"{debt_ratios[-1]:.1%}",
-                        f"{(debt_ratios[-1] - debt_ratios[0]):.1%}"
-                    )
-
-                with col2:
-                    fixed_asset_ratios = [
-                        f / a for f, a in zip(
-                            forecast_df.loc["Fixed Assets(I)"],
-                            forecast_df.loc["Total Assets(F+G+H+I)"]
-                        )
-                    ]
-                    st.metric(
-                        "Fixed Asset Ratio",
-                        f"{fixed_asset_ratios[-1]:.1%}",
-                        f"{(fixed_asset_ratios[-1] - fixed_asset_ratios[0]):.1%}"
-                    )
-
-                with col3:
-                    equity_ratios = [
-                        e / a for e, a in zip(
-                            forecast_df.loc["Total Equity(L+M)"],
-                            forecast_df.loc["Total Assets(F+G+H+I)"]
-                        )
-                    ]
-                    st.metric(
-                        "Equity Ratio",
-                        f"{equity_ratios[-1]:.1%}",
-                        f"{(equity_ratios[-1] - equity_ratios[0]):.1%}"
-                    )
-
-                # Charts
-                fig = make_subplots(
-                    rows=2, cols=2,
-                    subplot_titles=(
-                        'Balance Sheet Structure',
-                        'Asset Composition',
-                        'Key Ratios Trend',
-                        'Equity & Liability Composition'
-                    ),
-                    specs=[[{"type": "bar"}, {"type": "pie"}],
-                           [{"type": "scatter"}, {"type": "pie"}]]
-                )
-
-                # Balance Sheet Structure
-                fig.add_trace(
-                    go.Bar(name='Total Assets',
-                           x=years,
-                           y=forecast_df.loc["Total Assets(F+G+H+I)"],
-                           marker_color='lightblue'),
-                    row=1, col=1
-                )
-                fig.add_trace(
-                    go.Bar(name='Total Equity',
-                           x=years,
-                           y=forecast_df.loc["Total Equity(L+M)"],
-                           marker_color='darkblue'),
-                    row=1, col=1
-                )
-                fig.update_layout(
-                    height=800,
-                    width=None,  # 自动适应宽度
-                    showlegend=True,
-                    margin=dict(l=20, r=20, t=40, b=20)  # 减少边距
-                )
-
-                # Asset Composition (latest year)
-                asset_composition = {
-                    'Cash': forecast_df.loc["Cash(F)"].iloc[-1],
-                    'AR': forecast_df.loc["Accounts Receivable(G)"].iloc[-1],
-                    'Prepayments': forecast_df.loc["Prepayments(H)"].iloc[-1],
-                    'Fixed Assets': forecast_df.loc["Fixed Assets(I)"].iloc[-1]
-                }
-                fig.add_trace(
-                    go.Pie(values=list(asset_composition.values()),
-                           labels=list(asset_composition.keys()),
-                           name="Asset Composition"),
-                    row=1, col=2
-                )
+            pl_rows = dict(zip(profit_loss_data.index, profit_loss_data.to_numpy()))
+            forecast_df = _compute_bs_forecast(
+                tuple(pl_rows["Revenue(A)"].tolist()),
+                tuple(pl_rows["Cost(B)"].tolist()),
+                tuple(pl_rows["Net Profit(A-B-C-D-E)"].tolist()),
+                receivables_ratio,
+                prepayment_ratio,
+                payables_ratio,
+                advance_ratio,
+                fixed_asset_growth,
+                capital_increase
+            )
+        except Exception as e:
+            st.error(f"Error generating forecast: {str(e)}")
+            return None
 
-                # Key Ratios Trend
-                fig.add_trace(
-                    go.Scatter(x=years, y=debt_ratios,
-                               name='Debt Ratio',
-                               mode='lines+markers'),
-                    row=2, col=1
-                )
-                fig.add_trace(
-                    go.Scatter(x=years, y=equity_ratios,
-                               name='Equity Ratio',
-                               mode='lines+markers'),
-                    row=2, col=1
+        st.session_state['balance_sheet_data'] = forecast_df
+        st.session_state['is_bs_generated'] = True
+        # Rerun the whole app so the cash flow tab and the sidebar pick up the new state
+        st.rerun()
+
+    forecast_df = st.session_state.get('balance_sheet_data')
+    if forecast_df is None:
+        return None
+
+    try:
+        # Display results
+        with right_column:
+            # Key metrics
+            st.subheader("Key Metrics")
+            col1, col2, col3 = st.columns(3)
+            bs_rows = dict(zip(forecast_df.index, forecast_df.to_numpy()))
+            total_assets = bs_rows["Total Assets(F+G+H+I)"]
+
+            with col1:
+                debt_ratios = bs_rows["Total Liabilities(J+K)"] / total_assets
+                st.metric(
+                    "Debt Ratio",
+                    f"{debt_ratios[-1]:.1%}",
+                    f"{(debt_ratios[-1] - debt_ratios[0]):.1%}"
                 )
 
-                # Liability & Equity Composition (latest year)
-                le_composition = {
-                    'Liabilities': forecast_df.loc["Total Liabilities(J+K)"].iloc[-1],
-                    'Equity': forecast_df.loc["Total Equity(L+M)"].iloc[-1]
-                }
-                fig.add_trace(
-                    go.Pie(values=list(le_composition.values()),
-                           labels=list(le_composition.keys()),
-                           name="L&E Composition"),
-                    row=2, col=2
+            with col2:
+                fixed_asset_ratios = bs_rows["Fixed Assets(I)"] / total_assets
+                st.metric(
+                    "Fixed Asset Ratio",
+                    f"{fixed_asset_ratios[-1]:.1%}",
+                    f"{(fixed_asset_ratios[-1] - fixed_asset_ratios[0]):.1%}"
                 )
 
-                fig.update_layout(height=800, showlegend=True)
-                st.plotly_chart(fig, use_container_width=True)
-
-                # Display forecast table
-                st.subheader("Balance Sheet Forecast")
-                st.dataframe(
-                    forecast_df.round(2),
-                    width=None,  # 自动适应宽度
-                    height=None  # 自动调整高度
+            with col3:
+                equity_ratios = bs_rows["Total Equity(L+M)"] / total_assets
+                st.metric(
+                    "Equity Ratio",
+                    f"{equity_ratios[-1]:.1%}",
+                    f"{(equity_ratios[-1] - equity_ratios[0]):.1%}"
                 )
 
-            st.success("✅ Balance Sheet Forecast Generated")
-            return forecast_df
-
-        except Exception as e:
-            st.error(f"Error generating forecast: {str(e)}")
-            return None
-
-    return None
+            # Charts
+            fig_json = _build_bs_figure(forecast_df, debt_ratios, equity_ratios)
+            st.plotly_chart(pio.from_json(fig_json), use_container_width=True)
+
+            # Display forecast table
+            st.subheader("Balance Sheet Forecast")
+            st.dataframe(
+                forecast_df,
+                column_config={
+                    year: st.column_config.NumberColumn(format="%.2f")
+                    for year in forecast_df.columns
+                },
+                width=None,  # 自动适应宽度
+                height=None  # 自动调整高度
+            )
+
+        st.success("✅ Balance Sheet Forecast Generated")
+        return forecast_df
+
+    except Exception as e:
+        st.error(f"Error generating forecast: {str(e)}")
+        return None
 
 
 if __name__ == "__main__":
@@ -3,9 +3,156 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
+import plotly.io as pio
 from plotly.subplots import make_subplots
 
+YEARS = ["2023A", "2024E", "2025E", "2026E"]
 
+
+@st.cache_data
+def _compute_cf_forecast(net_profits, fixed_assets, receivables, prepayments, payables,
+                         advances, share_capital, depreciation_rate):
+    """
+    Compute cash flow forecast (cached on the P&L/balance sheet tuples and assumptions)
+    net_profits, fixed_assets, ...: tuples of statement values for all years
+    """
+    net_profits = np.asarray(net_profits)
+    fixed_assets = np.asarray(fixed_assets)
+    capital_changes = np.diff(share_capital)
+
+    # Calculate depreciation
+    depreciation = fixed_assets * depreciation_rate
+
+    # Calculate working capital changes
+    receivables_change = np.diff(receivables)
+    prepayments_change = np.diff(prepayments)
+    payables_change = np.diff(payables)
+    advances_change = np.diff(advances)
+
+    # Operating cash flow: net profit plus depreciation, adjusted for working capital
+    operating_cash_flows = np.concatenate([
+        [net_profits[0] + depreciation[0]],
+        net_profits[1:] + depreciation[1:]
+        - receivables_change
+        - prepayments_change
+        + payables_change
+        + advances_change
+    ])
+
+    # Investing cash flow (fixed assets investment)
+    investing_cash_flows = np.concatenate([[0], -(np.diff(fixed_assets) + depreciation[1:])])
+
+    # Financing cash flow
+    financing_cash_flows = np.concatenate([[0], capital_changes])
+
+    # Calculate net cash flow
+    net_cash_flows = operating_cash_flows + investing_cash_flows + financing_cash_flows
+
+    # Create cash flow statement
+    cf_arr = np.stack([
+        operating_cash_flows,
+        investing_cash_flows,
+        financing_cash_flows,
+        net_cash_flows
+    ])
+    cash_flow_df = pd.DataFrame(
+        cf_arr,
+        index=[
+            "Operating Cash Flow(N)",
+            "Investing Cash Flow(O)",
+            "Financing Cash Flow(P)",
+            "**Net Cash Flow(N+O+P)**"
+        ],
+        columns=YEARS
+    )
+
+    return cash_flow_df
+
+
+@st.cache_data
+def _build_cf_figure(cash_flow_df):
+    """Build cash flow charts and return the serialized figure JSON (cached)"""
+    # Rows: operating, investing, financing, net
+    cf_arr = cash_flow_df.to_numpy()
+
+    fig = make_subplots(
+        rows=2, cols=2,
+        subplot_titles=(
+            'Cash Flow Components',
+            'Cash Flow Waterfall',
+            'Cash Flow Trends',
+            'Cash Flow Composition'
+        ),
+        specs=[
+            [{"type": "bar"}, {"type": "waterfall"}],
+            [{"type": "scatter"}, {"type": "pie"}]  # 明确指定饼图类型
+        ]
+    )
+
+    # Cash Flow Components
+    bar_operating = go.Bar(
+        name='Operating CF',
+        x=YEARS[1:],
+        y=cf_arr[0, 1:],
+        marker_color='green'
+    )
+    bar_investing = go.Bar(
+        name='Investing CF',
+        x=YEARS[1:],
+        y=cf_arr[1, 1:],
+        marker_color='red'
+    )
+    bar_financing = go.Bar(
+        name='Financing CF',
+        x=YEARS[1:],
+        y=cf_arr[2, 1:],
+        marker_color='blue'
+    )
+
+    # Waterfall chart
+    waterfall = go.Waterfall(
+        name="Waterfall",
+        orientation="v",
+        measure=["relative"] * 3,
+        x=["Operating", "Investing", "Financing"],
+        y=cf_arr[:3, -1],
+        connector={"line": {"color": "rgb(63, 63, 63)"}},
+    )
+
+    # Cash Flow Trends
+    scatter_net = go.Scatter(
+        name='Net Cash Flow',
+        x=YEARS,
+        y=cf_arr[3],
+        mode='lines+markers',
+        line=dict(color='purple', width=2)
+    )
+
+    # Cash Flow Composition (Pie Chart)
+    pie_composition = go.Pie(
+        values=np.abs(cf_arr[:3, -1]),
+        labels=['Operating', 'Investing', 'Financing'],
+        hole=0.3
+    )
+
+    # Add all traces in a single validation pass
+    fig.add_traces(
+        [bar_operating, bar_investing, bar_financing, waterfall, scatter_net, pie_composition],
+        rows=[1, 1, 1, 1, 2, 2],
+        cols=[1, 1, 1, 2, 1, 2]
+    )
+
+    fig.update_layout(
+        height=800,
+        width=None,
+        showlegend=True,
+        margin=dict(l=20, r=20, t=40, b=20)
+    )
+
+    return fig.to_json()
+
+
+@st.fragment
 def create_cash_flow_section(profit_loss_data, balance_sheet_data):
     """
     Create cash flow statement forecast
@@ -29,79 +176,21 @@ def create_cash_flow_section(profit_loss_data, balance_sheet_data):
 
     if st.button("Generate Cash Flow Forecast"):
         try:
-            years = ["2023A", "2024E", "2025E", "2026E"]
-
-            # Get data from P&L
-            net_profits = profit_loss_data.loc["Net Profit(A-B-C-D-E)"].values
-
-            # Get data from Balance Sheet
-            fixed_assets = balance_sheet_data.loc["Fixed Assets(I)"].values
-            receivables = balance_sheet_data.loc["Accounts Receivable(G)"].values
-            prepayments = balance_sheet_data.loc["Prepayments(H)"].values
-            payables = balance_sheet_data.loc["Accounts Payable(J)"].values
-            advances = balance_sheet_data.loc["Advances from Customers(K)"].values
-            capital_changes = np.diff(balance_sheet_data.loc["Share Capital(L)"].values)
-
-            # Calculate depreciation
-            depreciation = fixed_assets * depreciation_rate
-
-            # Calculate working capital changes
-            receivables_change = np.diff(receivables)
-            prepayments_change = np.diff(prepayments)
-            payables_change = np.diff(payables)
-            advances_change = np.diff(advances)
-
-            # Initialize cash flows
-            operating_cash_flows = []
-            investing_cash_flows = []
-            financing_cash_flows = []
-
-            # First year data
-            operating_cash_flows.append(net_profits[0] + depreciation[0])
-            investing_cash_flows.append(0)
-            financing_cash_flows.append(0)
-
-            # Calculate cash flows for forecast years
-            for i in range(1, 4):
-                # Operating cash flow
-                operating_cf = (
-                        net_profits[i] +  # Net profit
-                        depreciation[i] -  # Add back depreciation
-                        receivables_change[i - 1] -  # Change in receivables
-                        prepayments_change[i - 1] +  # Change in prepayments
-                        payables_change[i - 1] +  # Change in payables
-                        advances_change[i - 1]  # Change in advances
-                )
-                operating_cash_flows.append(operating_cf)
-
-                # Investing cash flow (fixed assets investment)
-                investing_cf = -(fixed_assets[i] - fixed_assets[i - 1] + depreciation[i])
-                investing_cash_flows.append(investing_cf)
-
-                # Financing cash flow
-                financing_cf = capital_changes[i - 1]
-                financing_cash_flows.append(financing_cf)
-
-            # Calculate net cash flow
-            net_cash_flows = [
-                op + inv + fin
-                for op, inv, fin in zip(
-                    operating_cash_flows,
-                    investing_cash_flows,
-                    financing_cash_flows
-                )
-            ]
-
-            # Create cash flow statement
-            cash_flow_data = {
-                "Operating Cash Flow(N)": operating_cash_flows,
-                "Investing Cash Flow(O)": investing_cash_flows,
-                "Financing Cash Flow(P)": financing_cash_flows,
-                "**Net Cash Flow(N+O+P)**": net_cash_flows
-            }
-
-            # Create DataFrame
-            cash_flow_df = pd.DataFrame(cash_flow_data, index=years).T
+            pl_rows = dict(zip(profit_loss_data.index, profit_loss_data.to_numpy()))
+            bs_rows = dict(zip(balance_sheet_data.index, balance_sheet_data.to_numpy()))
+            cash_flow_df = _compute_cf_forecast(
+                tuple(pl_rows["Net Profit(A-B-C-D-E)"].tolist()),
+                tuple(bs_rows["Fixed Assets(I)"].tolist()),
+                tuple(bs_rows["Accounts Receivable(G)"].tolist()),
+                tuple(bs_rows["Prepayments(H)"].tolist()),
+                tuple(bs_rows["Accounts Payable(J)"].tolist()),
+                tuple(bs_rows["Advances from Customers(K)"].tolist()),
+                tuple(bs_rows["Share Capital(L)"].tolist()),
+                depreciation_rate
+            )
+            net_profits = pl_rows["Net Profit(A-B-C-D-E)"]
+            # Rows: operating, investing, financing, net
+            cf_arr = cash_flow_df.to_numpy()
 
             with right_column:
                 # Display key metrics
@@ -109,10 +198,10 @@ def create_cash_flow_section(profit_loss_data, balance_sheet_data):
                 col1, col2, col3 = st.columns(3)
 
                 with col1:
-                    operating_cf_ratio = [
-                        ocf / np if np != 0 else 0
-                        for ocf, np in zip(operating_cash_flows, net_profits)
-                    ]
+                    operating_cf_ratio = np.divide(
+                        cf_arr[0], net_profits,
+                        out=np.zeros_like(cf_arr[0]), where=net_profits != 0
+                    )
                     st.metric(
                         "Operating CF / Net Profit",
                         f"{operating_cf_ratio[-1]:.1%}",
@@ -120,10 +209,10 @@ def create_cash_flow_section(profit_loss_data, balance_sheet_data):
                     )
 
                 with col2:
-                    capex_ratio = [
-                        -icf / ocf if ocf != 0 else 0
-                        for icf, ocf in zip(investing_cash_flows, operating_cash_flows)
-                    ]
+                    capex_ratio = np.divide(
+                        -cf_arr[1], cf_arr[0],
+                        out=np.zeros_like(cf_arr[1]), where=cf_arr[0] != 0
+                    )
                     st.metric(
                         "CAPEX / Operating CF",
                         f"{capex_ratio[-1]:.1%}",
@@ -131,7 +220,7 @@ def create_cash_flow_section(profit_loss_data, balance_sheet_data):
                     )
 
                 with col3:
-                    cf_growth = (net_cash_flows[-1] / net_cash_flows[0]) ** (1 / 3) - 1 if net_cash_flows[0] != 0 else 0
+                    cf_growth = (cf_arr[3, -1] / cf_arr[3, 0]) ** (1 / 3) - 1 if cf_arr[3, 0] != 0 else 0
                     st.metric(
                         "Net CF CAGR",
                         f"{cf_growth:.1%}",
@@ -139,102 +228,17 @@ def create_cash_flow_section(profit_loss_data, balance_sheet_data):
                     )
 
                 # Create visualization
-                fig = make_subplots(
-                    rows=2, cols=2,
-                    subplot_titles=(
-                        'Cash Flow Components',
-                        'Cash Flow Waterfall',
-                        'Cash Flow Trends',
-                        'Cash Flow Composition'
-                    ),
-                    specs=[
-                        [{"type": "bar"}, {"type": "waterfall"}],
-                        [{"type": "scatter"}, {"type": "pie"}]  # 明确指定饼图类型
-                    ]
-                )
-
-                # Cash Flow Components
-                fig.add_trace(
-                    go.Bar(
-                        name='Operating CF',
-                        x=years[1:],
-                        y=operating_cash_flows[1:],
-                        marker_color='green'
-                    ),
-                    row=1, col=1
-                )
-                fig.add_trace(
-                    go.Bar(
-                        name='Investing CF',
-                        x=years[1:],
-                        y=investing_cash_flows[1:],
-                        marker_color='red'
-                    ),
-                    row=1, col=1
-                )
-                fig.add_trace(
-                    go.Bar(
-                        name='Financing CF',
-                        x=years[1:],
-                        y=financing_cash_flows[1:],
-                        marker_color='blue'
-                    ),
-                    row=1, col=1
-                )
-
-                # Waterfall chart
-                fig.add_trace(
-                    go.Waterfall(
-                        name="Waterfall",
-                        orientation="v",
-                        measure=["relative"] * 3,
-                        x=["Operating", "Investing", "Financing"],
-                        y=[operating_cash_flows[-1], investing_cash_flows[-1], financing_cash_flows[-1]],
-                        connector={"line": {"color": "rgb(63, 63, 63)"}},
-                    ),
-                    row=1, col=2
-                )
-
-                # Cash Flow Trends
-                fig.add_trace(
-                    go.Scatter(
-                        name='Net Cash Flow',
-                        x=years,
-                        y=net_cash_flows,
-                        mode='lines+markers',
-                        line=dict(color='purple', width=2)
-                    ),
-                    row=2, col=1
-                )
-
-                # Cash Flow Composition (Pie Chart)
-                last_year_data = {
-                    'Operating': abs(operating_cash_flows[-1]),
-                    'Investing': abs(investing_cash_flows[-1]),
-                    'Financing': abs(financing_cash_flows[-1])
-                }
-                fig.add_trace(
-                    go.Pie(
-                        values=list(last_year_data.values()),
-                        labels=list(last_year_data.keys()),
-                        hole=0.3
-                    ),
-                    row=2, col=2
-                )
-
-                fig.update_layout(
-                    height=800,
-                    width=None,
-                    showlegend=True,
-                    margin=dict(l=20, r=20, t=40, b=20)
-                )
-
-                st.plotly_chart(fig, use_container_width=True)
+                fig_json = _build_cf_figure(cash_flow_df)
+                st.plotly_chart(pio.from_json(fig_json), use_container_width=True)
 
                 # Display forecast table
                 st.subheader("Cash Flow Forecast")
                 st.dataframe(
-                    cash_flow_df.round(2),
+                    cash_flow_df,
+                    column_config={
+                        year: st.column_config.NumberColumn(format="%.2f")
+                        for year in cash_flow_df.columns
+                    },
                     width=None,
                     height=None
                 )
@@ -2,14 +2,14 @@
 import streamlit as st
 import pandas as pd
 from profit_loss import create_profit_loss_section
-from balance_sheet import create_balance_sheet_section
-from cash_flow import create_cash_flow_section
 
 
 def init_session_state():
     """Initialize session state variables"""
     if 'profit_loss_data' not in st.session_state:
         st.session_state['profit_loss_data'] = None
+    if 'pnl_forecast' not in st.session_state:
+        st.session_state['pnl_forecast'] = None
     if 'balance_sheet_data' not in st.session_state:
         st.session_state['balance_sheet_data'] = None
     if 'is_pl_generated' not in st.session_state:
@@ -21,6 +21,7 @@ def init_session_state():
 def reset_all_data():
     """Reset all data"""
     st.session_state['profit_loss_data'] = None
+    st.session_state['pnl_forecast'] = None
     st.session_state['balance_sheet_data'] = None
     st.session_state['is_pl_generated'] = False
     st.session_state['is_bs_generated'] = False
@@ -43,29 +44,26 @@ st.title("Financial Forecast Model")
 # Create tabs
 tab1, tab2, tab3 = st.tabs(["P&L Forecast", "Balance Sheet Forecast", "Cash Flow Forecast"])
 
+# Each section is a fragment that stores its own results in session state,
+# so widget interactions only rerun the tab they belong to
+
 # P&L Tab
 with tab1:
-    pl_result = create_profit_loss_section()
-    if pl_result is not None:
-        st.session_state['profit_loss_data'] = pl_result
-        st.session_state['is_pl_generated'] = True
-        # Clear subsequent forecasts when P&L is regenerated
-        st.session_state['balance_sheet_data'] = None
-        st.session_state['is_bs_generated'] = False
+    create_profit_loss_section()
 
 # Balance Sheet Tab
 with tab2:
     if st.session_state['is_pl_generated']:
-        bs_result = create_balance_sheet_section(st.session_state['profit_loss_data'])
-        if bs_result is not None:
-            st.session_state['balance_sheet_data'] = bs_result
-            st.session_state['is_bs_generated'] = True
+        # Imported lazily so the P&L-only path doesn't pay for loading this module
+        from balance_sheet import create_balance_sheet_section
+        create_balance_sheet_section(st.session_state['profit_loss_data'])
     else:
         st.info("⚠️ Please generate P&L forecast first")
 
 # Cash Flow Tab
 with tab3:
     if st.session_state['is_pl_generated'] and st.session_state['is_bs_generated']:
+        from cash_flow import create_cash_flow_section
         create_cash_flow_section(
             st.session_state['profit_loss_data'],
             st.session_state['balance_sheet_data']
@@ -1,256 +1,382 @@
 # profit_loss.py
 import streamlit as st
 import pandas as pd
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+import numpy as np
+from numba import njit
+
+YEARS = ("2024E", "2025E", "2026E")
+FORECAST_YEARS = ("2023A",) + YEARS
+
+# P&L line items, in forecast row order
+_ROWS = (
+    "Revenue(A)",
+    "Cost(B)",
+    "Gross Profit(A-B)",
+    "Selling Expense(C)",
+    "Admin Expense(D)",
+    "Financial Expense(E)",
+    "Net Profit(A-B-C-D-E)"
+)
+
+# Historical data (2023)
+_HIST_VALUES = np.array([1000.00, 600.00, 400.00, 100.00, 80.00, 20.00, 200.00], dtype=np.float64)
+_HIST_VALUES.flags.writeable = False
+_HIST_DF = pd.DataFrame({"Amount": dict(zip(_ROWS, _HIST_VALUES))})
+
+# Historical Revenue, Cost, Selling, Admin and Financial Expense, the forecast kernel's inputs
+HIST = _HIST_VALUES[[0, 1, 3, 4, 5]]
+
+# Slider settings: (label, min, max, default, step, key prefix), in _compute_forecast order
+SPECS = (
+    ("Growth Rate(%)", 0.0, 50.0, 15.0, 1.0, "revenue_growth"),
+    ("Cost Ratio(%)", 40.0, 80.0, 60.0, 1.0, "cost_ratio"),
+    ("Selling(%)", 0.0, 30.0, 10.0, 0.5, "sales"),
+    ("Admin(%)", 0.0, 20.0, 7.0, 0.5, "management"),
+    ("Financial(%)", 0.0, 10.0, 2.0, 0.5, "financial"),
+)
+KEYS = {(spec[-1], year): f"{spec[-1]}_{year}" for spec in SPECS for year in YEARS}
+
+# Monte Carlo run: number of scenarios, half-width of the sampling band around each
+# submitted input (as a share of that slider's range), and final-year outcome columns
+_MC_SAMPLES = 10000
+_MC_BAND = 0.1
+_MC_COLUMNS = (f"{YEARS[-1]} Revenue", f"{YEARS[-1]} Net Profit", f"{YEARS[-1]} Net Margin")
+
+# Vertical spacing between slider groups, injected once per run as CSS classes
+_CSS = "<style>.pnl-gap{height:20px}.pnl-gap-lg{height:30px}</style>"
+_GAP = "<div class='pnl-gap'></div>"
+_HEADING = "<div class='pnl-gap-lg'></div>\n\n### {}\n\n<div class='pnl-gap'></div>"
+
+# Two stacked charts (amounts on top, ratios below) with a 0.12 vertical gap
+_SUBPLOT_TITLE_FONT = dict(size=16)
+_FIGURE_LAYOUT = dict(
+    xaxis=dict(anchor='y', domain=[0.0, 1.0]),
+    yaxis=dict(anchor='x', domain=[0.56, 1.0], title=dict(text='Amount')),
+    xaxis2=dict(anchor='y2', domain=[0.0, 1.0]),
+    yaxis2=dict(anchor='x2', domain=[0.0, 0.44], title=dict(text='Ratio')),
+    annotations=[
+        dict(text='Financial Performance', x=0.5, y=1.0, xref='paper', yref='paper',
+             xanchor='center', yanchor='bottom', showarrow=False, font=_SUBPLOT_TITLE_FONT),
+        dict(text='Margin Trends', x=0.5, y=0.44, xref='paper', yref='paper',
+             xanchor='center', yanchor='bottom', showarrow=False, font=_SUBPLOT_TITLE_FONT)
+    ],
+    height=600,
+    showlegend=True,
+    title_text="Financial Analysis"
+)
+
+
+@njit(cache=True, fastmath=True)
+def _forecast_kernel(hist, growth, cost, sell, admin, fin):
+    """
+    Roll the P&L forward one year at a time
+    hist: historical revenue, cost, selling, admin and financial expense
+    growth, cost, sell, admin, fin: per-year ratios for the forecast years
+    Returns a (7, len(growth) + 1) array in _ROWS order with the historical year in column 0
+    """
+    n_years = growth.shape[0]
+    out = np.empty((7, n_years + 1))
+    out[0, 0] = hist[0]
+    out[1, 0] = hist[1]
+    out[3, 0] = hist[2]
+    out[4, 0] = hist[3]
+    out[5, 0] = hist[4]
+
+    for i in range(1, n_years + 1):
+        # Calculate revenues, costs and expenses
+        out[0, i] = out[0, i - 1] * (1 + growth[i - 1])
+        out[1, i] = out[0, i] * cost[i - 1]
+        out[3, i] = out[0, i] * sell[i - 1]
+        out[4, i] = out[0, i] * admin[i - 1]
+        out[5, i] = out[0, i] * fin[i - 1]
+
+    # Calculate profits
+    for i in range(n_years + 1):
+        out[2, i] = out[0, i] - out[1, i]
+        out[6, i] = out[2, i] - out[3, i] - out[4, i] - out[5, i]
+
+    return out
+
+
+# Compile once at import so the first forecast doesn't pay the JIT cost
+_forecast_kernel(HIST, np.zeros(len(YEARS)), np.zeros(len(YEARS)), np.zeros(len(YEARS)),
+                 np.zeros(len(YEARS)), np.zeros(len(YEARS)))
+
+
+@st.cache_data(show_spinner=False, max_entries=128)
+def _compute_forecast(growth, cost, sell, admin, fin):
+    """
+    Compute P&L forecast (cached on the slider tuples)
+    growth, cost, sell, admin, fin: tuples of per-year ratios
+    Returns (forecast_df, gross_margins, net_margins, revenues, operating_profits)
+    """
+    data = _forecast_kernel(
+        HIST,
+        np.asarray(growth, dtype=np.float64),
+        np.asarray(cost, dtype=np.float64),
+        np.asarray(sell, dtype=np.float64),
+        np.asarray(admin, dtype=np.float64),
+        np.asarray(fin, dtype=np.float64)
+    )
+    revenues, gross_profits, operating_profits = data[0], data[2], data[6]
+
+    # Create forecast DataFrame
+    forecast_df = pd.DataFrame(data, index=list(_ROWS), columns=list(FORECAST_YEARS))
+
+    # Margins
+    gross_margins = gross_profits / revenues
+    net_margins = operating_profits / revenues
+
+    return forecast_df, gross_margins, net_margins, revenues, operating_profits
+
+
+@njit(cache=True, fastmath=True)
+def _forecast_batch(hist, growth, cost, sell, admin, fin):
+    """
+    Run _forecast_kernel for a batch of independent scenarios
+    growth, cost, sell, admin, fin: (S, T) arrays of per-scenario, per-year ratios
+    Returns an (S, 7, T + 1) array
+    """
+    n_scenarios, n_years = growth.shape
+    out = np.empty((n_scenarios, 7, n_years + 1))
+
+    for s in range(n_scenarios):
+        out[s] = _forecast_kernel(hist, growth[s], cost[s], sell[s], admin[s], fin[s])
+
+    return out
+
+
+# Compile once at import so the first Monte Carlo run doesn't pay the JIT cost
+_forecast_batch(HIST, np.zeros((1, len(YEARS))), np.zeros((1, len(YEARS))),
+                np.zeros((1, len(YEARS))), np.zeros((1, len(YEARS))), np.zeros((1, len(YEARS))))
+
+
+@st.cache_data(show_spinner=False, max_entries=128)
+def _compute_monte_carlo(growth, cost, sell, admin, fin, n_samples, seed=0):
+    """
+    Forecast n_samples scenarios drawn uniformly from a band around the given ratios
+    growth, cost, sell, admin, fin: tuples of per-year ratios, as for _compute_forecast
+    Returns final-year percentiles of revenue, net profit and net margin
+    """
+    rng = np.random.default_rng(seed)
+    ratios = np.array([growth, cost, sell, admin, fin], dtype=np.float64)
+
+    # Sample within _MC_BAND of each slider's range, clipped to the slider bounds
+    min_values = np.array([spec[1] for spec in SPECS])[:, None] / 100
+    max_values = np.array([spec[2] for spec in SPECS])[:, None] / 100
+    half_width = _MC_BAND * (max_values - min_values)
+    low = np.maximum(ratios - half_width, min_values)
+    high = np.minimum(ratios + half_width, max_values)
+    samples = rng.uniform(low[:, None, :], high[:, None, :],
+                          size=(len(SPECS), n_samples, len(YEARS)))
+
+    # Final-year revenue and net profit per scenario
+    final = _forecast_batch(HIST, *samples)[:, :, -1]
+    outcomes = np.stack([final[:, 0], final[:, 6], final[:, 6] / final[:, 0]], axis=1)
+
+    return pd.DataFrame(
+        np.percentile(outcomes, [5, 50, 95], axis=0),
+        index=["P5", "P50", "P95"],
+        columns=list(_MC_COLUMNS)
+    )
+
+
+@st.cache_data(show_spinner=False, max_entries=128)
+def _build_figure(revenues, operating_profits, gross_margins, net_margins):
+    """Build P&L charts and return the serialized figure JSON (cached)"""
+    import plotly.graph_objects as go
+
+    fig = go.Figure(
+        data=[
+            # Financial performance trend
+            go.Bar(
+                name='Revenue',
+                x=YEARS,
+                y=revenues[1:],
+                marker_color='lightblue',
+                xaxis='x', yaxis='y'
+            ),
+            go.Bar(
+                name='Net Profit',
+                x=YEARS,
+                y=operating_profits[1:],
+                marker_color='darkblue',
+                xaxis='x', yaxis='y'
+            ),
+            # Margin trends
+            go.Scatter(
+                name='Gross Margin',
+                x=YEARS,
+                y=gross_margins[1:],
+                mode='lines+markers',
+                line=dict(color='green'),
+                xaxis='x2', yaxis='y2'
+            ),
+            go.Scatter(
+                name='Net Margin',
+                x=YEARS,
+                y=net_margins[1:],
+                mode='lines+markers',
+                line=dict(color='red'),
+                xaxis='x2', yaxis='y2'
+            )
+        ],
+        layout=_FIGURE_LAYOUT
+    )
+
+    return fig.to_json()
+
+
+@st.fragment
+def _render_results():
+    """Render metrics, charts and table from the stored P&L forecast"""
+    forecast = st.session_state.get('pnl_forecast')
+    if forecast is None:
+        return
+
+    forecast_df, gross_margins, net_margins, revenues, operating_profits = forecast
+
+    # Display results
+    st.subheader("Key Metrics")
+    col1, col2, col3 = st.columns(3)
+
+    with col1:
+        st.metric(
+            "Gross Margin",
+            f"{gross_margins[-1]:.1%}",
+            f"{(gross_margins[-1] - gross_margins[0]):.1%}"
+        )
+
+    with col2:
+        st.metric(
+            "Net Margin",
+            f"{net_margins[-1]:.1%}",
+            f"{(net_margins[-1] - net_margins[0]):.1%}"
+        )
+
+    with col3:
+        revenue_growth = (revenues[-1] / revenues[0]) ** (1 / len(YEARS)) - 1
+        st.metric(
+            "Revenue CAGR",
+            f"{revenue_growth:.1%}",
+            ""
+        )
+
+    # Charts (plotly is imported here so loading the module doesn't pay for it)
+    import plotly.io as pio
+
+    fig_json = _build_figure(revenues, operating_profits, gross_margins, net_margins)
+    # Static by default: plotly.js skips hover/zoom handlers and the mode bar
+    interactive = st.checkbox("Interactive chart", value=False, key="pnl_interactive_chart")
+    st.plotly_chart(
+        pio.from_json(fig_json),
+        use_container_width=True,
+        config={"staticPlot": not interactive, "displayModeBar": interactive},
+        theme=None
+    )
+
+    # Display forecast table
+    st.subheader("P&L Forecast")
+    st.dataframe(
+        forecast_df,
+        column_config={
+            year: st.column_config.NumberColumn(format="%.2f")
+            for year in forecast_df.columns
+        }
+    )
 
+    st.success("✅ P&L Forecast Generated")
 
+
+@st.fragment
 def create_profit_loss_section():
     """Create profit and loss forecast section"""
+    st.markdown(_CSS, unsafe_allow_html=True)
     left_column, right_column = st.columns([1, 2])
 
-    # Historical data (2023)
-    historical_data = {
-        "Revenue(A)": 1000,
-        "Cost(B)": 600,
-        "Gross Profit(A-B)": 400,
-        "Selling Expense(C)": 100,
-        "Admin Expense(D)": 80,
-        "Financial Expense(E)": 20,
-        "Net Profit(A-B-C-D-E)": 200,
-    }
-
     with left_column:
         st.subheader("Historical Data (2023)")
-        hist_df = pd.DataFrame({"Amount": historical_data}).round(2)
-        st.dataframe(hist_df)
-
-        st.markdown("<div style='height: 30px'></div>", unsafe_allow_html=True)
-        st.markdown("### Revenue Growth Rate")
-        st.markdown("<div style='height: 20px'></div>", unsafe_allow_html=True)
-
-        years = ["2024E", "2025E", "2026E"]
-
-        # Revenue growth settings
-        revenue_growth_rates = []
-        for year in years:
-            growth = st.slider(
-                f"{year} Growth Rate(%)",
-                min_value=0.0,
-                max_value=50.0,
-                value=15.0,
-                step=1.0,
-                key=f"revenue_growth_{year}"
-            ) / 100
-            revenue_growth_rates.append(growth)
-
-        st.markdown("<div style='height: 30px'></div>", unsafe_allow_html=True)
-        st.markdown("### Cost/Revenue Ratio")
-        st.markdown("<div style='height: 20px'></div>", unsafe_allow_html=True)
-
-        # Cost ratio settings
-        cost_ratios = []
-        for year in years:
-            ratio = st.slider(
-                f"{year} Cost Ratio(%)",
-                min_value=40.0,
-                max_value=80.0,
-                value=60.0,
-                step=1.0,
-                key=f"cost_ratio_{year}"
-            ) / 100
-            cost_ratios.append(ratio)
-
-        st.markdown("<div style='height: 30px'></div>", unsafe_allow_html=True)
-        st.markdown("### Expense Ratios")
-        st.markdown("<div style='height: 20px'></div>", unsafe_allow_html=True)
-
-        # Expense ratios
-        sales_expense_ratios = []
-        management_expense_ratios = []
-        financial_expense_ratios = []
-
-        for year in years:
-            st.markdown(f"**{year}**")
-            col1, col2, col3 = st.columns([1, 1, 1])
-
-            with col1:
-                sales = st.slider(
-                    "Selling(%)",
-                    min_value=0.0,
-                    max_value=30.0,
-                    value=10.0,
-                    step=0.5,
-                    key=f"sales_{year}"
-                ) / 100
-                sales_expense_ratios.append(sales)
-
-            with col2:
-                management = st.slider(
-                    "Admin(%)",
-                    min_value=0.0,
-                    max_value=20.0,
-                    value=7.0,
-                    step=0.5,
-                    key=f"management_{year}"
-                ) / 100
-                management_expense_ratios.append(management)
-
-            with col3:
-                financial = st.slider(
-                    "Financial(%)",
-                    min_value=0.0,
-                    max_value=10.0,
-                    value=2.0,
-                    step=0.5,
-                    key=f"financial_{year}"
-                ) / 100
-                financial_expense_ratios.append(financial)
-
-            st.markdown("<div style='height: 20px'></div>", unsafe_allow_html=True)
-
-    forecast_df = None
-
-    if st.button("Generate P&L Forecast"):
-        # Generate forecast data
-        forecast_years = ["2023A"] + years
-        revenues = [historical_data["Revenue(A)"]]
-
-        # Calculate revenues
-        for growth_rate in revenue_growth_rates:
-            revenues.append(revenues[-1] * (1 + growth_rate))
-
-        # Calculate costs and profits
-        costs = [historical_data["Cost(B)"]] + [rev * ratio for rev, ratio in zip(revenues[1:], cost_ratios)]
-        gross_profits = [rev - cost for rev, cost in zip(revenues, costs)]
-
-        sales_expenses = [historical_data["Selling Expense(C)"]] + [rev * ratio for rev, ratio in
-                                                                    zip(revenues[1:], sales_expense_ratios)]
-        management_expenses = [historical_data["Admin Expense(D)"]] + [rev * ratio for rev, ratio in
-                                                                       zip(revenues[1:], management_expense_ratios)]
-        financial_expenses = [historical_data["Financial Expense(E)"]] + [rev * ratio for rev, ratio in
-                                                                          zip(revenues[1:], financial_expense_ratios)]
-
-        operating_profits = [
-            rev - cost - sales - mgmt - fin
-            for rev, cost, sales, mgmt, fin in zip(
-                revenues, costs, sales_expenses, management_expenses, financial_expenses
-            )
-        ]
-
-        # Create forecast DataFrame
-        data = {
-            "Revenue(A)": revenues,
-            "Cost(B)": costs,
-            "Gross Profit(A-B)": gross_profits,
-            "Selling Expense(C)": sales_expenses,
-            "Admin Expense(D)": management_expenses,
-            "Financial Expense(E)": financial_expenses,
-            "Net Profit(A-B-C-D-E)": operating_profits
-        }
+        st.dataframe(
+            _HIST_DF,
+            column_config={"Amount": st.column_config.NumberColumn(format="%.2f")}
+        )
+
+        # Sliders only take effect on submit, so dragging them doesn't rerun the section
+        with st.form("pnl_inputs", clear_on_submit=False):
+            # Slider percentages, one row per SPECS entry and one column per year
+            inputs = np.empty((len(SPECS), len(YEARS)))
+
+            # Revenue growth and cost ratio settings
+            for i, heading in enumerate(("Revenue Growth Rate", "Cost/Revenue Ratio")):
+                st.markdown(_HEADING.format(heading), unsafe_allow_html=True)
+                label, min_value, max_value, value, step, prefix = SPECS[i]
+                for j, year in enumerate(YEARS):
+                    inputs[i, j] = st.slider(
+                        f"{year} {label}",
+                        min_value=min_value,
+                        max_value=max_value,
+                        value=value,
+                        step=step,
+                        key=KEYS[prefix, year]
+                    )
+
+            # Expense ratios
+            st.markdown(_HEADING.format("Expense Ratios"), unsafe_allow_html=True)
+            for j, year in enumerate(YEARS):
+                st.markdown(f"**{year}**")
+                for i, column in enumerate(st.columns([1, 1, 1]), start=2):
+                    label, min_value, max_value, value, step, prefix = SPECS[i]
+                    with column:
+                        inputs[i, j] = st.slider(
+                            label,
+                            min_value=min_value,
+                            max_value=max_value,
+                            value=value,
+                            step=step,
+                            key=KEYS[prefix, year]
+                        )
+
+                st.markdown(_GAP, unsafe_allow_html=True)
+
+            submitted = st.form_submit_button("Generate P&L Forecast")
+
+    # growth, cost, selling, admin and financial ratios as tuples of fractions; widgets
+    # in a form keep their last submitted values until the form is submitted again
+    ratios = [tuple(row) for row in (inputs / 100).tolist()]
+
+    if submitted:
+        forecast = _compute_forecast(*ratios)
+
+        st.session_state['pnl_forecast'] = forecast
+        st.session_state['profit_loss_data'] = forecast[0]
+        st.session_state['is_pl_generated'] = True
+        # Clear subsequent forecasts when P&L is regenerated
+        st.session_state['balance_sheet_data'] = None
+        st.session_state['is_bs_generated'] = False
+        # Rerun the whole app so the other tabs and the sidebar pick up the new state
+        st.rerun()
+
+    with right_column:
+        _render_results()
 
-        forecast_df = pd.DataFrame(data, index=forecast_years).T
+    with left_column:
+        run_monte_carlo = st.button(
+            "Run Monte Carlo",
+            help=f"Forecast {_MC_SAMPLES:,} scenarios sampled around the submitted assumptions"
+        )
 
-        # Display results
+    if run_monte_carlo:
         with right_column:
-            st.subheader("Key Metrics")
-            col1, col2, col3 = st.columns(3)
-
-            with col1:
-                gross_margins = [gp / rev for gp, rev in zip(gross_profits, revenues)]
-                st.metric(
-                    "Gross Margin",
-                    f"{gross_margins[-1]:.1%}",
-                    f"{(gross_margins[-1] - gross_margins[0]):.1%}"
-                )
-
-            with col2:
-                net_margins = [np / rev for np, rev in zip(operating_profits, revenues)]
-                st.metric(
-                    "Net Margin",
-                    f"{net_margins[-1]:.1%}",
-                    f"{(net_margins[-1] - net_margins[0]):.1%}"
-                )
-
-            with col3:
-                revenue_growth = (revenues[-1] / revenues[0]) ** (1 / 3) - 1
-                st.metric(
-                    "Revenue CAGR",
-                    f"{revenue_growth:.1%}",
-                    ""
-                )
-
-            # Charts
-            fig = make_subplots(
-                rows=2, cols=1,
-                subplot_titles=('Financial Performance', 'Margin Trends'),
-                vertical_spacing=0.12
-            )
-
-            # Financial performance trend
-            fig.add_trace(
-                go.Bar(
-                    name='Revenue',
-                    x=years,
-                    y=revenues[1:],
-                    marker_color='lightblue'
-                ),
-                row=1, col=1
+            st.subheader(f"Monte Carlo ({_MC_SAMPLES:,} scenarios)")
+            st.dataframe(
+                _compute_monte_carlo(*ratios, _MC_SAMPLES),
+                column_config={
+                    column: st.column_config.NumberColumn(format=fmt)
+                    for column, fmt in zip(_MC_COLUMNS, ("%.2f", "%.2f", "%.3f"))
+                }
             )
 
-            fig.add_trace(
-                go.Bar(
-                    name='Net Profit',
-                    x=years,
-                    y=operating_profits[1:],
-                    marker_color='darkblue'
-                ),
-                row=1, col=1
-            )
-
-            # Margin trends
-            fig.add_trace(
-                go.Scatter(
-                    name='Gross Margin',
-                    x=years,
-                    y=gross_margins[1:],
-                    mode='lines+markers',
-                    line=dict(color='green')
-                ),
-                row=2, col=1
-            )
-
-            fig.add_trace(
-                go.Scatter(
-                    name='Net Margin',
-                    x=years,
-                    y=net_margins[1:],
-                    mode='lines+markers',
-                    line=dict(color='red')
-                ),
-                row=2, col=1
-            )
-
-            # Update layout
-            fig.update_layout(
-                height=600,
-                showlegend=True,
-                title_text="Financial Analysis"
-            )
-
-            # Update y-axes labels
-            fig.update_yaxes(title_text="Amount", row=1, col=1)
-            fig.update_yaxes(title_text="Ratio", row=2, col=1)
-
-            st.plotly_chart(fig, use_container_width=True)
-
-            # Display forecast table
-            st.subheader("P&L Forecast")
-            st.dataframe(forecast_df.round(2))
-
-            st.success("✅ P&L Forecast Generated")
-
-    return forecast_df
+    return st.session_state.get('profit_loss_data')
 
 
 if __name__ == "__main__":